@@ -5,10 +5,14 @@ Module Docstring.
 
 import argparse
 import csv
-import os
+import io
 import sys
+from calendar import monthrange
 from datetime import datetime
 from enum import Enum
+from functools import lru_cache, partial
+from pathlib import Path
+from typing import Callable, Iterator, Optional, TextIO
 
 
 class AccountType(Enum):
@@ -17,102 +21,205 @@ class AccountType(Enum):
     GIROKONTO_NEU = "Girokonto (Neu)"
 
 
-def open_file(filename: str, offset: int) -> csv.DictReader:
-    """Open a CSV file and return a DictReader."""
-    csvfile = open(filename, mode="r", encoding="utf-8")
+class _DKBDialect(csv.excel):
+    """CSV dialect of the DKB exports: semicolon separated, double quoted."""
 
-    dialect = csv.Sniffer().sniff(csvfile.read(1024))
-    csvfile.seek(0)
+    delimiter = ";"
 
-    for _ in range(offset):
-        csvfile.readline()
 
-    return csv.DictReader(csvfile, dialect=dialect)
+# Entfernt Tausendertrennzeichen und ersetzt das Dezimalkomma in einem Durchlauf
+_DE_NUM_TABLE = str.maketrans({".": None, ",": "."})
+
+# Puffergröße für Ein- und Ausgabedateien
+_BUFFER_SIZE = 1 << 20
+
+# Größe des Blocks, in dem der Vorspann der Exporte gesucht wird
+_HEAD_SIZE = 8192
+
+
+def open_file(
+    filename: str, offset: int
+) -> tuple[TextIO, Iterator[list[str]], Optional[list[str]]]:
+    """Open a CSV file and return it with a reader and its header row.
+
+    The caller is responsible for closing the returned file. The header row
+    is None if the file ends before it.
+    """
+    rawfile = open(filename, mode="rb", buffering=_BUFFER_SIZE)
+
+    try:
+        # Vorspann in einem Block überspringen statt Zeile für Zeile
+        head = rawfile.read(_HEAD_SIZE)
+        position = 0
+        skipped = 0
+        while skipped < offset:
+            newline = head.find(b"\n", position)
+            if newline < 0:
+                break
+            position = newline + 1
+            skipped += 1
+        rawfile.seek(position)
+
+        # Falls der Vorspann länger als der gelesene Block ist
+        for _ in range(offset - skipped):
+            rawfile.readline()
+
+        csvfile = io.TextIOWrapper(rawfile, encoding="utf-8", newline="")
+        reader = csv.reader(csvfile, dialect=_DKBDialect)
+        return csvfile, reader, next(reader, None)
+    except BaseException:
+        rawfile.close()
+        raise
 
 
 def convert_german_to_american(number_string):
     """Convert a number from German format to American format."""
-    # Entfernen der deutschen Tausendertrennzeichen
-    number_string = number_string.replace(".", "")
-    # Konvertieren des deutschen Dezimaltrennzeichens in das amerikanische
-    number_string = number_string.replace(",", ".")
+    # Leere Felder ohne teure Ausnahme abfangen
+    if not number_string:
+        return None
+
+    # Währungsangabe und Vorzeichen nur an den Rändern entfernen
+    number_string = (
+        number_string.strip()
+        .removesuffix("EUR")
+        .removesuffix("€")
+        .strip()
+        .removeprefix("+")
+    )
 
     try:
         # Konvertieren in float und Zurückgeben des Werts
-        return float(number_string)
+        return float(number_string.translate(_DE_NUM_TABLE))
     except ValueError:
         # Falls die Eingabe nicht in eine Zahl umgewandelt werden kann
         return None
 
 
+@lru_cache(maxsize=4096)
 def convert_date_format(date_str: str) -> str:
-    """Convert date from DD.MM.YY to DD/MM/YY format."""
+    """Convert date from DD.MM.YY or DD.MM.YYYY to DD/MM/YY format."""
+    # Schneller Pfad für die üblichen DKB-Formate ohne strptime
+    parts = date_str.split(".")
+    if len(parts) == 3:
+        day, month, year = parts
+        if (
+            0 < len(day) <= 2
+            and 0 < len(month) <= 2
+            and len(year) in (2, 4)
+            and date_str.isascii()
+            and day.isdecimal()
+            and month.isdecimal()
+            and year.isdecimal()
+        ):
+            # Zweistellige Jahre haben im Bereich von %y dieselben Schaltjahre
+            full_year = int(year) if len(year) == 4 else 2000 + int(year)
+            month_number = int(month)
+            if (
+                1 <= month_number <= 12
+                and 1 <= int(day) <= monthrange(full_year, month_number)[1]
+            ):
+                return f"{day.zfill(2)}/{month.zfill(2)}/{year[-2:]}"
+
     try:
         date_obj = datetime.strptime(date_str, "%d.%m.%y")
-        return date_obj.strftime("%d/%m/%y")
+        return f"{date_obj.day:02d}/{date_obj.month:02d}/{date_obj.year % 100:02d}"
     except ValueError:
         return date_str
 
 
+def _mapped_rows(
+    reader: Iterator[list[str]], header: list[str], columns: tuple[str, ...]
+) -> Iterator[tuple]:
+    """Yield YNAB rows by copying the given date, payee, memo and amount columns."""
+    date_index, payee_index, memo_index, amount_index = map(header.index, columns)
+    width = max(date_index, payee_index, memo_index, amount_index) + 1
+
+    for row in reader:
+        # Leere und verkürzte Zeilen wie Fußzeilen überspringen
+        if len(row) < width:
+            continue
+        yield (
+            convert_date_format(row[date_index]),
+            row[payee_index],
+            row[memo_index],
+            row[amount_index],
+        )
+
+
+def _girokonto_neu_rows(
+    reader: Iterator[list[str]], header: list[str]
+) -> Iterator[tuple]:
+    """Yield YNAB rows for a new Girokonto export."""
+    date_index = header.index("Wertstellung")
+    payer_index = header.index("Zahlungspflichtige*r")
+    payee_index = header.index("Zahlungsempfänger*in")
+    memo_index = header.index("Verwendungszweck")
+    amount_index = header.index("Betrag (€)")
+    width = max(date_index, payer_index, payee_index, memo_index, amount_index) + 1
+
+    for row in reader:
+        # Leere und verkürzte Zeilen wie Fußzeilen überspringen
+        if len(row) < width:
+            continue
+        amount = row[amount_index]
+        value = convert_german_to_american(amount)
+        if value is None:
+            # Zeilen ohne gültigen Betrag überspringen, aber nicht stillschweigend
+            print(
+                f"{sys.argv[0]}: {row[date_index]}: "
+                f"skipping row with invalid amount {amount!r}",
+                file=sys.stderr,
+            )
+            continue
+        # Bei Eingängen ist der Zahlungspflichtige der Payee
+        payee = row[payer_index] if value > 0 else row[payee_index]
+        yield (convert_date_format(row[date_index]), payee, row[memo_index], value)
+
+
+_ROW_GENERATORS: dict[
+    AccountType, Callable[[Iterator[list[str]], list[str]], Iterator[tuple]]
+] = {
+    AccountType.GIROKONTO: partial(
+        _mapped_rows,
+        columns=(
+            "Wertstellung",
+            "Auftraggeber / Begünstigter",
+            "Verwendungszweck",
+            "Betrag (EUR)",
+        ),
+    ),
+    AccountType.VISA: partial(
+        _mapped_rows,
+        columns=("Wertstellung", "Beschreibung", "", "Betrag (EUR)"),
+    ),
+    AccountType.GIROKONTO_NEU: _girokonto_neu_rows,
+}
+
+
 def convert(filename: str, filetype: AccountType) -> None:
     """Convert the file given by filename according to the given type. Export to the same directory."""
 
-    if filetype == AccountType.GIROKONTO or filetype == AccountType.VISA:
-        reader = open_file(filename, 6)
-    elif filetype == AccountType.GIROKONTO_NEU:
-        reader = open_file(filename, 4)
-
-    basename_without_ext = os.path.splitext(
-        os.path.basename(os.path.abspath(filename))
-    )[0]
-    export_filename = f"{basename_without_ext}-ynab.csv"
-    export_filename = os.path.join(os.path.dirname(filename), export_filename)
-
-    with open(export_filename, mode="w", encoding="utf-8") as csvfile:
-        fieldnames = ["Date", "Payee", "Memo", "Amount"]
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-
-        for row in reader:
-            date = convert_date_format(row["Wertstellung"])
-            if filetype == AccountType.GIROKONTO:
-                writer.writerow(
-                    {
-                        "Date": date,
-                        "Payee": row["Auftraggeber / Begünstigter"],
-                        "Memo": row["Verwendungszweck"],
-                        "Amount": row["Betrag (EUR)"],
-                    }
-                )
-            elif filetype == AccountType.VISA:
-                writer.writerow(
-                    {
-                        "Date": date,
-                        "Payee": row["Beschreibung"],
-                        "Memo": row[""],
-                        "Amount": row["Betrag (EUR)"],
-                    }
-                )
-            elif filetype == AccountType.GIROKONTO_NEU:
-                value = convert_german_to_american(row["Betrag (€)"])
-                if value > 0:
-                    writer.writerow(
-                        {
-                            "Date": date,
-                            "Payee": row["Zahlungspflichtige*r"],
-                            "Memo": row["Verwendungszweck"],
-                            "Amount": value,
-                        }
-                    )
-                else:
-                    writer.writerow(
-                        {
-                            "Date": date,
-                            "Payee": row["Zahlungsempfänger*in"],
-                            "Memo": row["Verwendungszweck"],
-                            "Amount": value,
-                        }
-                    )
+    if filetype is AccountType.GIROKONTO or filetype is AccountType.VISA:
+        infile, reader, header = open_file(filename, 6)
+    elif filetype is AccountType.GIROKONTO_NEU:
+        infile, reader, header = open_file(filename, 4)
+
+    source_path = Path(filename)
+    export_path = source_path.with_name(f"{source_path.stem}-ynab.csv")
+
+    with infile, open(
+        export_path,
+        mode="w",
+        encoding="utf-8",
+        newline="",
+        buffering=_BUFFER_SIZE,
+    ) as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(["Date", "Payee", "Memo", "Amount"])
+
+        # Ohne Kopfzeile enthält die Datei keine Umsätze
+        if header is not None:
+            writer.writerows(_ROW_GENERATORS[filetype](reader, header))
 
 
 def main() -> None: